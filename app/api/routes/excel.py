@@ -1,19 +1,37 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Body
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pathlib import Path
-import shutil
+import asyncio
+import io
+import uuid
 from datetime import datetime
 from typing import List, Optional
 
 from app.api.deps import get_db
+from app.database.session import SessionLocal, engine
 from app.models.registro import Registro
 from app.schemas.registro import RegistroResponse, ResponseModel
 from app.utils.excel_handler import ExcelHandler
-from app.config import UPLOADS_DIR, EXPORTS_DIR, MAX_FILE_SIZE, ALLOWED_EXTENSIONS
+from app.config import UPLOADS_DIR, MAX_FILE_SIZE, ALLOWED_EXTENSIONS, SPILL_TO_DISK_THRESHOLD
 
 router = APIRouter()
 
+# INSERT ... ON CONFLICT (email) DO NOTHING según el dialecto
+# (PostgreSQL en producción; SQLite para desarrollo local)
+if engine.dialect.name == "sqlite":
+    from sqlalchemy.dialects.sqlite import insert as insert_on_conflict
+else:
+    from sqlalchemy.dialects.postgresql import insert as insert_on_conflict
+
+# Adaptador cacheado para serializar lotes de registros creados
+_REGISTRO_LIST_ADAPTER = TypeAdapter(List[RegistroResponse])
+
+# Tamaño de bloque para lectura en streaming de archivos subidos
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+
 @router.get("/excel/plantilla")
 async def descargar_plantilla():
     """Descargar plantilla de Excel para importación"""
@@ -31,39 +49,38 @@ async def descargar_plantilla():
 @router.get("/excel/exportar", response_model=None)
 async def exportar_registros(
     estudio: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Exportar todos los registros a Excel"""
     try:
-        query = db.query(Registro)
-        
-        if estudio:
-            query = query.filter(Registro.estudio == estudio)
-        
-        registros = query.all()
-        
-        if not registros:
-            raise HTTPException(status_code=404, detail="No hay registros para exportar")
-        
-        registros_data = []
-        for registro in registros:
-            registros_data.append({
-                'id': registro.id,
-                'nombres': registro.nombres,
-                'apellidos': registro.apellidos,
-                'email': registro.email,
-                'estudio': registro.estudio,
-                'fecha_registro': registro.fecha_registro
-            })
-        
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"registros_sena_{timestamp}.xlsx"
-        filepath = ExcelHandler.export_to_excel(registros_data, filename)
-        
-        return FileResponse(
-            path=filepath,
-            filename=filename,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+        # Consulta en streaming: las filas se escriben al Excel según llegan
+        def _exportar(db_sync, estudio):
+            stmt = select(
+                Registro.id,
+                Registro.nombres,
+                Registro.apellidos,
+                Registro.email,
+                Registro.estudio,
+                Registro.fecha_registro
+            ).execution_options(stream_results=True, yield_per=1000)
+
+            if estudio:
+                stmt = stmt.where(Registro.estudio == estudio)
+
+            return ExcelHandler.export_to_excel(db_sync.execute(stmt))
+
+        buffer, total = await db.run_sync(_exportar, estudio)
+
+        if total == 0:
+            raise HTTPException(status_code=404, detail="No hay registros para exportar")
+
+        return StreamingResponse(
+            buffer,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
         )
     except HTTPException:
         raise
@@ -74,7 +91,7 @@ async def exportar_registros(
 async def importar_registros(
     file: UploadFile = File(...),
     sheet_names: Optional[str] = None,  # Nombres de hojas separados por coma
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Importar registros desde un archivo Excel
@@ -89,35 +106,52 @@ async def importar_registros(
             detail=f"Tipo de archivo no permitido. Use: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # Validar tamaño
-    file.file.seek(0, 2)
-    file_size = file.file.tell()
-    file.file.seek(0)
-    
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Archivo muy grande. Tamaño máximo: {MAX_FILE_SIZE / 1024 / 1024}MB"
-        )
-    
-    # Guardar archivo temporalmente
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    temp_filename = f"upload_{timestamp}_{file.filename}"
-    temp_filepath = UPLOADS_DIR / temp_filename
-    
+    # Nombre temporal por si hay que derramar a disco (uuid4 evita colisiones
+    # entre subidas concurrentes)
+    temp_filename = f"upload_{uuid.uuid4().hex}_{file.filename}"
+    temp_filepath = None
+
     try:
-        # Guardar archivo
-        with temp_filepath.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
+        # Leer en streaming validando el tamaño sobre la marcha. Los archivos
+        # pequeños se procesan en memoria; solo se escribe a disco al superar
+        # el umbral
+        total_bytes = 0
+        buffer_memoria = bytearray()
+        archivo_disco = None
+        try:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                total_bytes += len(chunk)
+                if total_bytes > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Archivo muy grande. Tamaño máximo: {MAX_FILE_SIZE / 1024 / 1024}MB"
+                    )
+                if archivo_disco is None and total_bytes > SPILL_TO_DISK_THRESHOLD:
+                    temp_filepath = UPLOADS_DIR / temp_filename
+                    archivo_disco = temp_filepath.open("wb")
+                    archivo_disco.write(buffer_memoria)
+                    buffer_memoria = bytearray()
+                if archivo_disco is not None:
+                    archivo_disco.write(chunk)
+                else:
+                    buffer_memoria.extend(chunk)
+        finally:
+            if archivo_disco is not None:
+                archivo_disco.close()
+
+        source = temp_filepath if temp_filepath is not None else io.BytesIO(bytes(buffer_memoria))
+
         # Procesar hojas especificadas o todas
         sheets_to_process = None
         if sheet_names:
             sheets_to_process = [s.strip() for s in sheet_names.split(',')]
-        
+
         # Importar desde múltiples hojas
         results_by_sheet = ExcelHandler.import_from_excel_multiple_sheets(
-            temp_filepath,
+            source,
             sheets_to_process
         )
         
@@ -126,50 +160,58 @@ async def importar_registros(
         total_registros_duplicados = []
         total_errores = []
         sheets_processed = {}
-        
-        for sheet_name, (registros_validos, errores) in results_by_sheet.items():
-            registros_creados_hoja = []
-            duplicados_hoja = []
-            errores_db_hoja = []
-            
+
+        hojas = list(results_by_sheet.items())
+
+        # Insertar cada hoja concurrentemente, cada una con su propia sesión.
+        # ON CONFLICT (email) DO NOTHING + RETURNING resuelve los duplicados en
+        # la base de datos de forma atómica: las filas devueltas son las
+        # creadas y el resto son duplicados, sin SELECT previo
+        async def _insertar_hoja(registros_validos):
+            if not registros_validos:
+                return [], []
+            async with SessionLocal() as sesion:
+                # Las filas van como parámetros executemany (no inline en
+                # .values()): insertmanyvalues pagina el lote y respeta el
+                # límite de 32k argumentos por sentencia de asyncpg
+                creados = (await sesion.scalars(
+                    insert_on_conflict(Registro)
+                    .on_conflict_do_nothing(index_elements=['email'])
+                    .returning(Registro),
+                    registros_validos
+                )).all()
+                registros_creados = _REGISTRO_LIST_ADAPTER.validate_python(creados)
+                await sesion.commit()
+
+            # Lo no devuelto por RETURNING ya existía (o se repetía en el lote)
+            emails_creados = {r.email for r in registros_creados}
+            duplicados = []
+            vistos = set()
             for registro_data in registros_validos:
-                try:
-                    # Verificar duplicado
-                    existing = db.query(Registro).filter(
-                        Registro.email == registro_data['email']
-                    ).first()
-                    
-                    if existing:
-                        duplicados_hoja.append(registro_data['email'])
-                        continue
-                    
-                    # Crear registro
-                    nuevo_registro = Registro(**registro_data)
-                    db.add(nuevo_registro)
-                    db.flush()
-                    
-                    registros_creados_hoja.append(RegistroResponse.from_orm(nuevo_registro))
-                    
-                except Exception as e:
-                    errores_db_hoja.append(f"{registro_data['email']}: {str(e)}")
-            
+                email = registro_data['email']
+                if email in emails_creados and email not in vistos:
+                    vistos.add(email)
+                    continue
+                duplicados.append(email)
+            return registros_creados, duplicados
+
+        resultados_por_hoja = await asyncio.gather(
+            *[_insertar_hoja(registros_validos) for _, (registros_validos, _) in hojas]
+        )
+
+        for (sheet_name, (registros_validos, errores)), (registros_creados_hoja, duplicados_hoja) in zip(hojas, resultados_por_hoja):
             # Guardar estadísticas por hoja
             sheets_processed[sheet_name] = {
                 "procesados": len(registros_validos),
                 "creados": len(registros_creados_hoja),
                 "duplicados": len(duplicados_hoja),
-                "errores": len(errores) + len(errores_db_hoja)
+                "errores": len(errores)
             }
-            
+
             total_registros_creados.extend(registros_creados_hoja)
             total_registros_duplicados.extend(duplicados_hoja)
             total_errores.extend(errores)
-            total_errores.extend(errores_db_hoja)
-        
-        # Commit si hay registros creados
-        if total_registros_creados:
-            db.commit()
-        
+
         # Preparar mensaje
         total_creados = len(total_registros_creados)
         total_duplicados = len(total_registros_duplicados)
@@ -199,11 +241,14 @@ async def importar_registros(
             }
         }
         
+    except HTTPException:
+        raise
+    
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error al procesar archivo: {str(e)}")
     
     finally:
-        # Limpiar archivo temporal
-        if temp_filepath.exists():
+        # Limpiar archivo temporal (solo existe si se derramó a disco)
+        if temp_filepath is not None and temp_filepath.exists():
             temp_filepath.unlink()
\ No newline at end of file
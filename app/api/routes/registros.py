@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import Optional
+from pydantic import TypeAdapter
+from sqlalchemy import bindparam, select, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from app.api.deps import get_db
 from app.models.registro import Registro
 from app.schemas.registro import (
@@ -14,6 +17,12 @@ from app.config import ESTUDIOS_DISPONIBLES
 
 router = APIRouter()
 
+# Adaptador cacheado: serializa la lista completa en una sola llamada a pydantic-core
+_REGISTRO_LIST_ADAPTER = TypeAdapter(List[RegistroResponse])
+
+# Consulta construida una sola vez: cada POST reutiliza el SQL ya compilado
+_GET_BY_EMAIL = select(Registro.id).where(Registro.email == bindparam('email'))
+
 @router.get("/estudios", response_model=ResponseModel)
 def obtener_estudios():
     """Obtener lista de estudios disponibles"""
@@ -24,131 +33,128 @@ def obtener_estudios():
     }
 
 @router.post("/registros", response_model=ResponseModel, status_code=201)
-def crear_registro(registro: RegistroCreate, db: Session = Depends(get_db)):
+async def crear_registro(registro: RegistroCreate, db: AsyncSession = Depends(get_db)):
     """Crear un nuevo registro"""
-    
-    # Validar que el estudio sea válido
-    if registro.estudio not in ESTUDIOS_DISPONIBLES:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Estudio inválido. Debe ser uno de: {', '.join(ESTUDIOS_DISPONIBLES)}"
-        )
-    
-    # Verificar si el email ya existe
-    existing = db.query(Registro).filter(Registro.email == registro.email).first()
-    if existing:
+
+    # Verificar si el email ya existe (el estudio ya fue validado por el schema)
+    existing = await db.scalar(_GET_BY_EMAIL, {'email': registro.email})
+    if existing is not None:
         raise HTTPException(
             status_code=400,
             detail="El email ya está registrado"
         )
-    
+
     # Crear nuevo registro
-    db_registro = Registro(**registro.dict())
-    
+    db_registro = Registro(**registro.model_dump())
+
     db.add(db_registro)
-    db.commit()
-    db.refresh(db_registro)
-    
+    await db.commit()
+
     return {
         "success": True,
         "message": "Registro creado exitosamente",
-        "data": RegistroResponse.from_orm(db_registro)
+        "data": RegistroResponse.model_validate(db_registro)
     }
 
 @router.get("/registros", response_model=ResponseModel)
-def obtener_registros(
+async def obtener_registros(
     skip: int = 0,
     limit: int = 100,
     estudio: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Obtener lista de registros con filtros opcionales"""
-    query = db.query(Registro)
-    
+    # Una sola consulta: la página de resultados y el total via COUNT(*) OVER ().
+    # Se seleccionan columnas sueltas para evitar instanciar objetos ORM
+    stmt = select(
+        Registro.id,
+        Registro.nombres,
+        Registro.apellidos,
+        Registro.email,
+        Registro.estudio,
+        Registro.fecha_registro,
+        func.count().over().label('total')
+    )
+
     if estudio:
-        query = query.filter(Registro.estudio == estudio)
-    
-    total = query.count()
-    registros = query.offset(skip).limit(limit).all()
-    
+        stmt = stmt.where(Registro.estudio == estudio)
+
+    stmt = stmt.order_by(Registro.id).offset(skip).limit(limit)
+
+    rows = (await db.execute(stmt)).mappings().all()
+    total = rows[0]['total'] if rows else 0
+
     return {
         "success": True,
         "message": "Registros obtenidos correctamente",
         "data": {
-            "registros": [RegistroResponse.from_orm(r) for r in registros],
+            "registros": _REGISTRO_LIST_ADAPTER.validate_python(rows),
             "total": total
         }
     }
 
 @router.get("/registros/{registro_id}", response_model=ResponseModel)
-def obtener_registro(registro_id: int, db: Session = Depends(get_db)):
+async def obtener_registro(registro_id: int, db: AsyncSession = Depends(get_db)):
     """Obtener un registro específico por ID"""
-    registro = db.query(Registro).filter(Registro.id == registro_id).first()
-    
+    registro = await db.scalar(select(Registro).where(Registro.id == registro_id))
+
     if not registro:
         raise HTTPException(status_code=404, detail="Registro no encontrado")
-    
+
     return {
         "success": True,
         "message": "Registro obtenido correctamente",
-        "data": RegistroResponse.from_orm(registro)
+        "data": RegistroResponse.model_validate(registro)
     }
 
 @router.put("/registros/{registro_id}", response_model=ResponseModel)
-def actualizar_registro(
+async def actualizar_registro(
     registro_id: int,
     registro_update: RegistroUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Actualizar un registro existente"""
-    
-    # Validar estudio
-    if registro_update.estudio not in ESTUDIOS_DISPONIBLES:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Estudio inválido. Debe ser uno de: {', '.join(ESTUDIOS_DISPONIBLES)}"
-        )
-    
-    registro = db.query(Registro).filter(Registro.id == registro_id).first()
-    
+
+    # Un solo UPDATE ... RETURNING: sin fila devuelta es 404, y la restricción
+    # UNIQUE de email convierte el duplicado en IntegrityError (400). El
+    # SAVEPOINT mantiene utilizable la transacción si el UPDATE falla
+    stmt = (
+        update(Registro)
+        .where(Registro.id == registro_id)
+        .values(**registro_update.model_dump())
+        .returning(Registro)
+    )
+
+    try:
+        async with db.begin_nested():
+            registro = await db.scalar(stmt)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="El email ya está registrado")
+
     if not registro:
         raise HTTPException(status_code=404, detail="Registro no encontrado")
-    
-    # Verificar si el nuevo email ya existe en otro registro
-    if registro_update.email != registro.email:
-        existing = db.query(Registro).filter(
-            Registro.email == registro_update.email,
-            Registro.id != registro_id
-        ).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="El email ya está registrado")
-    
-    # Actualizar campos
-    for field, value in registro_update.dict().items():
-        setattr(registro, field, value)
-    
-    db.commit()
-    db.refresh(registro)
-    
+
+    await db.commit()
+
     return {
         "success": True,
         "message": "Registro actualizado exitosamente",
-        "data": RegistroResponse.from_orm(registro)
+        "data": RegistroResponse.model_validate(registro)
     }
 
 @router.delete("/registros/{registro_id}", response_model=ResponseModel)
-def eliminar_registro(registro_id: int, db: Session = Depends(get_db)):
+async def eliminar_registro(registro_id: int, db: AsyncSession = Depends(get_db)):
     """Eliminar un registro"""
-    registro = db.query(Registro).filter(Registro.id == registro_id).first()
-    
+    registro = await db.scalar(select(Registro).where(Registro.id == registro_id))
+
     if not registro:
         raise HTTPException(status_code=404, detail="Registro no encontrado")
-    
-    db.delete(registro)
-    db.commit()
-    
+
+    await db.delete(registro)
+    await db.commit()
+
     return {
         "success": True,
         "message": "Registro eliminado exitosamente",
         "data": None
-    }
\ No newline at end of file
+    }
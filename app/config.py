@@ -13,6 +13,11 @@ EXPORTS_DIR.mkdir(exist_ok=True)
 # Configuración de base de datos
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db:5432/registros_db")
 
+# Configuración del pool de conexiones
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # segundos
+
 # Estudios disponibles (ACTUALIZADO para coincidir con frontend)
 ESTUDIOS_DISPONIBLES = [
     'Desarrollo Web',
@@ -27,6 +32,10 @@ ESTUDIOS_DISPONIBLES = [
     'Sistemas'
 ]
 
+# Versiones precalculadas para validación O(1) y mensajes de error
+ESTUDIOS_SET = frozenset(ESTUDIOS_DISPONIBLES)
+ESTUDIOS_JOINED = ", ".join(ESTUDIOS_DISPONIBLES)
+
 # Configuración de CORS
 ALLOWED_ORIGINS = [
     "http://localhost:4200",
@@ -36,4 +45,5 @@ ALLOWED_ORIGINS = [
 
 # Configuración de archivos
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+SPILL_TO_DISK_THRESHOLD = 4 * 1024 * 1024  # 4 MB: importaciones menores se procesan en memoria
 ALLOWED_EXTENSIONS = {'.xlsx', '.xls'}
\ No newline at end of file
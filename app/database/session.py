@@ -1,16 +1,32 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from app.config import DATABASE_URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
+from app.config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# El driver asyncpg requiere el prefijo postgresql+asyncpg://
+ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+
+# Las opciones de pool solo aplican a PostgreSQL (SQLite usa NullPool)
+_pool_kwargs = {}
+if ASYNC_DATABASE_URL.startswith("postgresql"):
+    _pool_kwargs = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_use_lifo": True
+    }
+
+# query_cache_size amplía la caché de SQL compilado (default 500)
+engine = create_async_engine(ASYNC_DATABASE_URL, query_cache_size=1200, **_pool_kwargs)
+# expire_on_commit=False evita el SELECT de recarga al leer atributos
+# después de un commit (p. ej. al serializar la respuesta de un POST/PUT)
+SessionLocal = async_sessionmaker(autoflush=False, bind=engine, expire_on_commit=False)
 Base = declarative_base()
 
-def get_db():
+async def get_db():
     """Dependencia de base de datos"""
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
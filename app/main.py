@@ -1,17 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.database.session import engine, Base
 from app.api.routes import registros, excel
 from app.config import ALLOWED_ORIGINS
 
-# Crear tablas
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Crear tablas
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield
 
 # Inicializar FastAPI
 app = FastAPI(
     title="Sistema de Registro API",
     description="API para gestión de registros de estudiantes con importación/exportación Excel",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from datetime import datetime
 from app.database.session import Base
 
 class Registro(Base):
     __tablename__ = "registros"
-    
+    __table_args__ = (
+        # Índice compuesto para paginar filtrando por estudio
+        Index('ix_registros_estudio_id', 'estudio', 'id'),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     nombres = Column(String, nullable=False)
     apellidos = Column(String, nullable=False)
@@ -1,12 +1,17 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from datetime import datetime
-from typing import Optional, Any, List
+from typing import Optional, Any, List, Literal
+from app.config import ESTUDIOS_DISPONIBLES
+
+# Tipo derivado de la configuración: pydantic-core rechaza estudios inválidos
+# al parsear el body, sin validación manual en las rutas
+EstudioType = Literal[tuple(ESTUDIOS_DISPONIBLES)]
 
 class RegistroBase(BaseModel):
     nombres: str = Field(..., min_length=1, max_length=100)
     apellidos: str = Field(..., min_length=1, max_length=100)
     email: EmailStr
-    estudio: str
+    estudio: EstudioType
 
 class RegistroCreate(RegistroBase):
     pass
@@ -15,11 +20,10 @@ class RegistroUpdate(RegistroBase):
     pass
 
 class RegistroResponse(RegistroBase):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     fecha_registro: datetime
-    
-    class Config:
-        from_attributes = True
 
 class ResponseModel(BaseModel):
     success: bool
@@ -1,164 +1,218 @@
+import io
+import re
 import pandas as pd
 from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
-from typing import List, Dict, Tuple
+from typing import Iterable, List, Dict, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+import zipfile
+from xml.etree import ElementTree
 from datetime import datetime
 from pathlib import Path
-from app.config import EXPORTS_DIR, ESTUDIOS_DISPONIBLES
+from app.config import EXPORTS_DIR, ESTUDIOS_DISPONIBLES, ESTUDIOS_SET, ESTUDIOS_JOINED
+
+# Formato de fecha usado al exportar
+_DATE_FMT = "%Y-%m-%d %H:%M:%S"
+
+# Estilos de encabezado (los objetos de estilo de openpyxl son inmutables,
+# así que se construyen una sola vez y se comparten entre llamadas)
+_HEADER_FILL = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+_TEMPLATE_HEADER_FILL = PatternFill(start_color="39a900", end_color="39a900", fill_type="solid")
+_HEADER_FONT = Font(bold=True, color="FFFFFF")
+_CENTER = Alignment(horizontal="center", vertical="center")
+
+# Email válido: algo@algo.algo, sin espacios ni arrobas extra
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+# Mapeo de columnas (flexible para diferentes formatos)
+_COLUMN_MAPPING = {
+    'nombres': ['nombres', 'nombre', 'first_name', 'firstname'],
+    'apellidos': ['apellidos', 'apellido', 'last_name', 'lastname'],
+    'email': ['email', 'correo', 'e-mail', 'mail'],
+    'estudio': ['estudio', 'estudios', 'carrera', 'programa', 'course']
+}
+
+# Índice invertido sinónimo -> campo, calculado una sola vez al importar
+_SYNONYM_TO_FIELD = {
+    synonym: field
+    for field, synonyms in _COLUMN_MAPPING.items()
+    for synonym in synonyms
+}
 
 class ExcelHandler:
     """Manejador de importación y exportación de archivos Excel"""
     
     @staticmethod
-    def export_to_excel(registros: List[Dict], filename: str = None) -> Path:
+    def export_to_excel(registros: Iterable[tuple]) -> Tuple[io.BytesIO, int]:
         """
         Exporta registros a un archivo Excel con formato
-        
+
         Args:
-            registros: Lista de diccionarios con los datos
-            filename: Nombre del archivo (opcional)
-            
+            registros: Iterable de tuplas (id, nombres, apellidos, email,
+                estudio, fecha_registro), por ejemplo filas de una consulta
+
         Returns:
-            Path del archivo generado
+            Tupla con (buffer en memoria con el .xlsx, total de filas exportadas)
         """
-        if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"registros_{timestamp}.xlsx"
-        
-        filepath = EXPORTS_DIR / filename
-        
-        # Crear workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Registros"
-        
-        # Encabezados
+        # Crear workbook en modo write-only (escritura en streaming)
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Registros")
+
+        # Ajustar ancho de columnas (antes de agregar filas en modo write-only)
+        column_widths = [10, 20, 20, 30, 25, 20]
+        for i, width in enumerate(column_widths, start=1):
+            ws.column_dimensions[chr(64 + i)].width = width
+
+        # Encabezados (en write-only los estilos van en la celda antes de agregarla)
         headers = ["ID", "Nombres", "Apellidos", "Email", "Estudio", "Fecha de Registro"]
-        ws.append(headers)
-        
-        # Estilo de encabezados
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Agregar datos
+        header_cells = []
+        for title in headers:
+            cell = WriteOnlyCell(ws, value=title)
+            cell.fill = _HEADER_FILL
+            cell.font = _HEADER_FONT
+            cell.alignment = _CENTER
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        # Agregar datos fila por fila según llegan del iterable
+        total = 0
         for registro in registros:
-            fecha = registro.get('fecha_registro', '')
-            if isinstance(fecha, datetime):
-                fecha = fecha.strftime("%Y-%m-%d %H:%M:%S")
-            
+            fecha = registro[5]
             ws.append([
-                registro.get('id', ''),
-                registro.get('nombres', ''),
-                registro.get('apellidos', ''),
-                registro.get('email', ''),
-                registro.get('estudio', ''),
-                fecha
+                registro[0], registro[1], registro[2], registro[3], registro[4],
+                fecha.strftime(_DATE_FMT) if isinstance(fecha, datetime) else fecha
             ])
-        
-        # Ajustar ancho de columnas
-        column_widths = [10, 20, 20, 30, 25, 20]
-        for i, width in enumerate(column_widths, start=1):
-            ws.column_dimensions[chr(64 + i)].width = width
-        
-        # Guardar archivo
-        wb.save(filepath)
-        return filepath
+            total += 1
+
+        # Guardar en un buffer en memoria (sin pasar por disco)
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+        return buffer, total
     
     @staticmethod
-    def get_sheet_names(filepath: Path) -> List[str]:
+    def get_sheet_names(filepath: Union[Path, io.BytesIO]) -> List[str]:
         """
         Obtiene los nombres de todas las hojas del archivo Excel
-        
+
         Args:
-            filepath: Ruta del archivo Excel
-            
+            filepath: Ruta del archivo Excel o buffer en memoria
+
         Returns:
             Lista con nombres de las hojas
         """
         try:
-            wb = load_workbook(filepath, read_only=True, data_only=True)
-            sheet_names = wb.sheetnames
-            wb.close()
-            return sheet_names
+            # Un .xlsx es un zip: basta extraer xl/workbook.xml (unos pocos KB)
+            # en lugar de cargar el workbook completo
+            if hasattr(filepath, 'seek'):
+                filepath.seek(0)
+            with zipfile.ZipFile(filepath) as zf:
+                root = ElementTree.fromstring(zf.read('xl/workbook.xml'))
+            ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+            return [
+                sheet.get('name')
+                for sheet in root.iter(f'{ns}sheet')
+            ]
         except Exception as e:
             return []
     
     @staticmethod
-    def import_from_excel_multiple_sheets(filepath: Path, sheet_names: List[str] = None) -> Dict[str, Tuple[List[Dict], List[str]]]:
+    def import_from_excel_multiple_sheets(source: Union[Path, io.BytesIO], sheet_names: List[str] = None) -> Dict[str, Tuple[List[Dict], List[str]]]:
         """
         Importa registros desde múltiples hojas de un archivo Excel
         
         Args:
-            filepath: Ruta del archivo Excel
+            source: Ruta del archivo Excel o buffer en memoria
             sheet_names: Lista de nombres de hojas a importar (None = todas)
             
         Returns:
             Diccionario con {nombre_hoja: (registros_válidos, errores)}
         """
         try:
-            # Obtener todas las hojas disponibles
-            xl_file = pd.ExcelFile(filepath)
+            # Obtener todas las hojas disponibles (mismo motor calamine que la lectura)
+            xl_file = pd.ExcelFile(source, engine='calamine')
             available_sheets = xl_file.sheet_names
-            
+
             # Si no se especifican hojas, importar todas
             if not sheet_names:
                 sheet_names = available_sheets
-            
+
             results = {}
-            
+            valid_sheets = []
+
             for sheet_name in sheet_names:
                 if sheet_name not in available_sheets:
                     results[sheet_name] = ([], [f"La hoja '{sheet_name}' no existe en el archivo"])
-                    continue
-                
-                # Procesar cada hoja
-                registros, errores = ExcelHandler._process_sheet(filepath, sheet_name)
-                results[sheet_name] = (registros, errores)
-            
+                else:
+                    results[sheet_name] = None  # Reserva la posición en el orden pedido
+                    valid_sheets.append(sheet_name)
+
+            # Los archivos en disco (subidas grandes derramadas por la ruta de
+            # importación) se leen por bloques para acotar la memoria; los
+            # buffers pequeños en memoria siguen por calamine
+            en_disco = isinstance(source, (str, Path)) and str(source).lower().endswith('.xlsx')
+
+            if len(valid_sheets) == 1:
+                # Una sola hoja: se reutiliza el archivo ya abierto
+                if en_disco:
+                    results[valid_sheets[0]] = ExcelHandler._process_sheet_streaming(source, valid_sheets[0])
+                else:
+                    results[valid_sheets[0]] = ExcelHandler._process_sheet(xl_file, valid_sheets[0])
+            elif valid_sheets:
+                # Varias hojas: parseo en paralelo. El lector calamine no se
+                # comparte entre hilos, así que cada uno abre el suyo (para
+                # buffers, sobre una vista propia de los mismos bytes)
+                raw = source.getvalue() if hasattr(source, 'getvalue') else None
+
+                def _parse(sheet_name):
+                    if en_disco:
+                        return ExcelHandler._process_sheet_streaming(source, sheet_name)
+                    per_thread_source = io.BytesIO(raw) if raw is not None else source
+                    return ExcelHandler._process_sheet(per_thread_source, sheet_name)
+
+                with ThreadPoolExecutor(max_workers=min(8, len(valid_sheets))) as pool:
+                    for sheet_name, parsed in zip(valid_sheets, pool.map(_parse, valid_sheets)):
+                        results[sheet_name] = parsed
+
             return results
-            
+
         except Exception as e:
             return {"error": ([], [f"Error al leer el archivo Excel: {str(e)}"])}
     
     @staticmethod
-    def _process_sheet(filepath: Path, sheet_name: str) -> Tuple[List[Dict], List[str]]:
+    def _process_sheet(source: Union[Path, io.BytesIO, pd.ExcelFile], sheet_name: str) -> Tuple[List[Dict], List[str]]:
         """
         Procesa una hoja específica del Excel
         
         Args:
-            filepath: Ruta del archivo Excel
+            source: Ruta del archivo Excel, buffer en memoria o pd.ExcelFile
+                ya abierto (evita descomprimir el archivo una vez por hoja)
             sheet_name: Nombre de la hoja
             
         Returns:
             Tupla con (registros_válidos, errores)
         """
         try:
-            # Leer hoja específica
-            df = pd.read_excel(filepath, sheet_name=sheet_name)
-            
-            # Mapeo de columnas (flexible para diferentes formatos)
-            column_mapping = {
-                'nombres': ['nombres', 'nombre', 'first_name', 'firstname'],
-                'apellidos': ['apellidos', 'apellido', 'last_name', 'lastname'],
-                'email': ['email', 'correo', 'e-mail', 'mail'],
-                'estudio': ['estudio', 'estudios', 'carrera', 'programa', 'course']
-            }
+            # Leer hoja específica (calamine: parser Rust, mucho más rápido que openpyxl)
+            # dtype=str evita la inferencia de tipos: todos los campos se usan como texto
+            if isinstance(source, pd.ExcelFile):
+                df = source.parse(sheet_name=sheet_name, dtype=str)
+            else:
+                # Los buffers en memoria se releen desde el inicio
+                if hasattr(source, 'seek'):
+                    source.seek(0)
+                df = pd.read_excel(source, sheet_name=sheet_name, engine='calamine', dtype=str)
             
             # Normalizar nombres de columnas
             df.columns = df.columns.str.strip().str.lower()
-            
-            # Mapear columnas
+
+            # Mapear columnas con el índice invertido precalculado
             mapped_columns = {}
-            for key, possible_names in column_mapping.items():
-                for col in df.columns:
-                    if col in possible_names:
-                        mapped_columns[key] = col
-                        break
+            for col in df.columns:
+                field = _SYNONYM_TO_FIELD.get(col)
+                if field is not None and field not in mapped_columns:
+                    mapped_columns[field] = col
             
             # Verificar que existan las columnas necesarias
             required_fields = ['nombres', 'apellidos', 'email', 'estudio']
@@ -167,52 +221,151 @@ class ExcelHandler:
             if missing_fields:
                 return [], [f"Hoja '{sheet_name}': Faltan columnas: {', '.join(missing_fields)}"]
             
-            # Renombrar columnas
-            df = df.rename(columns={v: k for k, v in mapped_columns.items()})
-            
-            # Filtrar solo las columnas necesarias
-            df = df[required_fields]
-            
-            # Limpiar datos
-            df = df.dropna(subset=required_fields)
-            df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-            
-            registros_validos = []
-            errores = []
-            
-            for idx, row in df.iterrows():
-                try:
-                    # Validar estudio
-                    estudio = str(row['estudio']).strip()
-                    if estudio not in ESTUDIOS_DISPONIBLES:
-                        errores.append(
-                            f"Hoja '{sheet_name}', Fila {idx + 2}: Estudio '{estudio}' no válido. "
-                            f"Debe ser: {', '.join(ESTUDIOS_DISPONIBLES)}"
-                        )
-                        continue
-                    
-                    # Validar email básico
-                    email = str(row['email']).strip().lower()
-                    if '@' not in email or '.' not in email:
-                        errores.append(f"Hoja '{sheet_name}', Fila {idx + 2}: Email '{email}' no válido")
-                        continue
-                    
-                    registro = {
-                        'nombres': str(row['nombres']).strip(),
-                        'apellidos': str(row['apellidos']).strip(),
-                        'email': email,
-                        'estudio': estudio
-                    }
-                    
-                    registros_validos.append(registro)
-                    
-                except Exception as e:
-                    errores.append(f"Hoja '{sheet_name}', Fila {idx + 2}: Error - {str(e)}")
-            
-            return registros_validos, errores
-            
+            # Seleccionar y renombrar en una sola pasada: una única copia en
+            # vez de una por el rename y otra por la reselección
+            df = df[[mapped_columns[field] for field in required_fields]]
+            df.columns = required_fields
+
+            return ExcelHandler._validate_frame(df, sheet_name)
+
         except Exception as e:
             return [], [f"Error al procesar hoja '{sheet_name}': {str(e)}"]
+
+    @staticmethod
+    def _validate_frame(df: pd.DataFrame, sheet_name: str) -> Tuple[List[Dict], List[str]]:
+        """
+        Valida un DataFrame ya mapeado a las columnas requeridas
+
+        El índice del DataFrame debe ser la posición original de la fila
+        (0 = primera fila de datos) para reportar números de fila correctos.
+
+        Args:
+            df: DataFrame con columnas nombres, apellidos, email, estudio
+            sheet_name: Nombre de la hoja (para los mensajes de error)
+
+        Returns:
+            Tupla con (registros_válidos, errores)
+        """
+        # Limpiar datos (copy() desliga el frame del original: las
+        # asignaciones de columnas siguientes no disparan SettingWithCopyWarning)
+        df = df.dropna(subset=list(df.columns)).copy()
+
+        # Sin filas tras la limpieza no hay nada que validar
+        if df.empty:
+            return [], []
+
+        for col in df.columns:
+            if df[col].dtype == "object":
+                df[col] = df[col].str.strip()
+
+        # Validación vectorizada: una máscara por columna en vez de
+        # iterar fila por fila con iterrows
+        df['email'] = df['email'].str.lower()
+        estudio_ok = df['estudio'].isin(ESTUDIOS_SET)
+        email_ok = df['email'].str.match(_EMAIL_RE, na=False)
+
+        errores = []
+        for fila in df.loc[~estudio_ok].itertuples():
+            errores.append(
+                f"Hoja '{sheet_name}', Fila {fila.Index + 2}: Estudio '{fila.estudio}' no válido. "
+                f"Debe ser: {ESTUDIOS_JOINED}"
+            )
+        for fila in df.loc[estudio_ok & ~email_ok].itertuples():
+            errores.append(f"Hoja '{sheet_name}', Fila {fila.Index + 2}: Email '{fila.email}' no válido")
+
+        # to_dict construye los diccionarios en C, sin pasar por itertuples
+        registros_validos = df.loc[estudio_ok & email_ok].to_dict(orient='records')
+
+        return registros_validos, errores
+
+    @staticmethod
+    def _iter_sheet(filepath: Path, sheet_name: str, chunk_size: int = 10_000):
+        """
+        Itera una hoja por bloques validados (para archivos grandes en disco)
+
+        Usa openpyxl en modo read_only, que itera las filas sin cargar la
+        hoja completa, y valida bloques de chunk_size filas con la misma
+        lógica vectorizada de _process_sheet. Como generador, el consumidor
+        puede procesar cada bloque (p. ej. insertarlo en la base de datos)
+        sin retener nunca la hoja completa en memoria.
+
+        Args:
+            filepath: Ruta del archivo Excel en disco
+            sheet_name: Nombre de la hoja
+            chunk_size: Filas por bloque de validación
+
+        Yields:
+            Tuplas (registros_válidos, errores) por bloque
+        """
+        required_fields = ['nombres', 'apellidos', 'email', 'estudio']
+        try:
+            wb = load_workbook(filepath, read_only=True, data_only=True)
+            try:
+                rows = wb[sheet_name].iter_rows(values_only=True)
+
+                # Mapear el encabezado con el índice invertido precalculado
+                header = next(rows, None) or ()
+                mapped_columns = {}
+                for idx, col in enumerate(header):
+                    field = _SYNONYM_TO_FIELD.get(str(col).strip().lower() if col is not None else '')
+                    if field is not None and field not in mapped_columns:
+                        mapped_columns[field] = idx
+
+                missing_fields = [field for field in required_fields if field not in mapped_columns]
+                if missing_fields:
+                    yield [], [f"Hoja '{sheet_name}': Faltan columnas: {', '.join(missing_fields)}"]
+                    return
+
+                col_idx = [mapped_columns[field] for field in required_fields]
+
+                chunk = []
+                offset = 0  # Posición de la primera fila del bloque actual
+
+                def _validar(chunk):
+                    df = pd.DataFrame(
+                        chunk,
+                        columns=required_fields,
+                        index=range(offset, offset + len(chunk))
+                    )
+                    return ExcelHandler._validate_frame(df, sheet_name)
+
+                for row in rows:
+                    chunk.append([
+                        valor if isinstance(valor, str) or valor is None else str(valor)
+                        for valor in (row[i] if i < len(row) else None for i in col_idx)
+                    ])
+                    if len(chunk) >= chunk_size:
+                        yield _validar(chunk)
+                        offset += len(chunk)
+                        chunk = []
+
+                if chunk:
+                    yield _validar(chunk)
+            finally:
+                wb.close()
+
+        except Exception as e:
+            yield [], [f"Error al procesar hoja '{sheet_name}': {str(e)}"]
+
+    @staticmethod
+    def _process_sheet_streaming(filepath: Path, sheet_name: str, chunk_size: int = 10_000) -> Tuple[List[Dict], List[str]]:
+        """
+        Procesa una hoja con el lector por bloques y acumula el resultado
+
+        Args:
+            filepath: Ruta del archivo Excel en disco
+            sheet_name: Nombre de la hoja
+            chunk_size: Filas por bloque de validación
+
+        Returns:
+            Tupla con (registros_válidos, errores)
+        """
+        registros_validos = []
+        errores = []
+        for registros, errs in ExcelHandler._iter_sheet(filepath, sheet_name, chunk_size):
+            registros_validos.extend(registros)
+            errores.extend(errs)
+        return registros_validos, errores
     
     @staticmethod
     def import_from_excel(filepath: Path) -> Tuple[List[Dict], List[str]]:
@@ -237,52 +390,44 @@ class ExcelHandler:
         """
         filename = "plantilla_registros.xlsx"
         filepath = EXPORTS_DIR / filename
-        
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Plantilla Registros"
-        
-        # Encabezados
+
+        # Workbook en modo write-only, igual que el exportador
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Plantilla Registros")
+
+        # Ajustar anchos (antes de agregar filas en modo write-only)
+        ws.column_dimensions['A'].width = 20
+        ws.column_dimensions['B'].width = 20
+        ws.column_dimensions['C'].width = 30
+        ws.column_dimensions['D'].width = 25
+
+        def _header_cell(hoja, title):
+            cell = WriteOnlyCell(hoja, value=title)
+            cell.fill = _TEMPLATE_HEADER_FILL
+            cell.font = _HEADER_FONT
+            cell.alignment = _CENTER
+            return cell
+
+        # Todas las filas se construyen primero (encabezado con estilo +
+        # ejemplos) y se vuelcan en una sola pasada
         headers = ["Nombres", "Apellidos", "Email", "Estudio"]
-        ws.append(headers)
-        
-        # Estilo de encabezados
-        header_fill = PatternFill(start_color="39a900", end_color="39a900", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Agregar ejemplos
-        ejemplos = [
+        filas = [[_header_cell(ws, title) for title in headers]] + [
             ["Juan Carlos", "Pérez García", "juan.perez@example.com", "Técnico"],
             ["María José", "González López", "maria.gonzalez@example.com", "Tecnólogo"],
             ["Carlos Alberto", "Rodríguez Martínez", "carlos.rodriguez@example.com", "Especialización"]
         ]
-        
-        for ejemplo in ejemplos:
-            ws.append(ejemplo)
-        
-        # Agregar hoja con estudios disponibles
+        for fila in filas:
+            ws.append(fila)
+
+        # Agregar hoja con estudios disponibles, con el mismo esquema
         ws_estudios = wb.create_sheet("Estudios Disponibles")
-        ws_estudios.append(["Estudios Válidos"])
-        
-        header_cell = ws_estudios['A1']
-        header_cell.fill = header_fill
-        header_cell.font = header_font
-        header_cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        for estudio in ESTUDIOS_DISPONIBLES:
-            ws_estudios.append([estudio])
-        
-        # Ajustar anchos
-        ws.column_dimensions['A'].width = 20
-        ws.column_dimensions['B'].width = 20
-        ws.column_dimensions['C'].width = 30
-        ws.column_dimensions['D'].width = 25
         ws_estudios.column_dimensions['A'].width = 30
-        
+
+        filas_estudios = [[_header_cell(ws_estudios, "Estudios Válidos")]] + [
+            [estudio] for estudio in ESTUDIOS_DISPONIBLES
+        ]
+        for fila in filas_estudios:
+            ws_estudios.append(fila)
+
         wb.save(filepath)
         return filepath
\ No newline at end of file